@@ -1,16 +1,24 @@
 import os
 import io
+import re
+import string
 import qrcode
 import logging
 import asyncio
+import hmac
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+from functools import lru_cache, partial
 from datetime import datetime, timedelta
 from typing import Dict, Any
 from contextlib import asynccontextmanager
 from collections import defaultdict
 
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import ORJSONResponse
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
@@ -21,10 +29,29 @@ from telegram.ext import (
     filters,
 )
 from telegram.error import BadRequest
+from sqlalchemy import func, or_, and_, select, text, insert as sql_insert, update as sql_update
+from sqlalchemy.orm import joinedload, selectinload
 
 import config
-from database import Session, User, Product, Order, Payment, ShippingAddress, Cart, CartItem, OrderItem
+from database import Session, dialect_insert, init_db, User, Product, Order, Payment, ShippingAddress, Cart, CartItem, OrderItem
 from monero_handler import MoneroHandler
+from cache import BoundedLRU
+
+ORDERS_PAGE_SIZE = 10
+
+# Callback data of buttons sent before the "<op>:<id>" format -> current opcode
+LEGACY_CALLBACK_OPS = {
+    "add_to_cart": "atc",
+    "product_details": "pd",
+    "check_payment": "cp",
+    "order_details": "od",
+}
+
+# Load an order's items, their products and the shipping address up front
+ORDER_DETAIL_LOAD = (
+    selectinload(Order.order_items).joinedload(OrderItem.product),
+    joinedload(Order.shipping_address),
+)
 
 # -------------------------
 # Logging
@@ -33,6 +60,8 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+# httpx logs every request at INFO (Telegram API and Monero RPC polling alike)
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # -------------------------
@@ -54,6 +83,16 @@ class RateLimiter:
 
 rate_limiter = RateLimiter()
 
+# -------------------------
+# Shared HTTP Session (keep-alive)
+# -------------------------
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=2, backoff_factor=0.2),
+))
+
 # -------------------------
 # XMR Price Helper
 # -------------------------
@@ -61,7 +100,7 @@ class XMRPrice:
     @staticmethod
     def get_xmr_price() -> float:
         try:
-            response = requests.get(
+            response = http_session.get(
                 "https://api.coingecko.com/api/v3/simple/price?ids=monero&vs_currencies=usd",
                 timeout=10
             )
@@ -76,6 +115,67 @@ class XMRPrice:
         usd_price = XMRPrice.get_xmr_price()
         return xmr_amount * usd_price
 
+@lru_cache(maxsize=2)
+def _xmr_price_for_minute(minute_epoch: int) -> float:
+    return XMRPrice.get_xmr_price()
+
+@lru_cache(maxsize=4096)
+def _format_price_with_usd_cached(xmr_amount: float, minute_epoch: int) -> str:
+    """Format an XMR amount with its USD value at the rate for the given minute"""
+    usd_amount = xmr_amount * _xmr_price_for_minute(minute_epoch)
+    return f"{xmr_amount:.6f} XMR (≈${usd_amount:.2f} USD)"
+
+# -------------------------
+# Shipping Input Validation
+# -------------------------
+# step -> (minimum length, length error, optional allowed-characters pattern, pattern error)
+SHIPPING_VALIDATORS = {
+    'full_name': (3, "Full name must be at least 3 characters", None, None),
+    'street_address': (5, "Street address too short", None, None),
+    'city': (2, "City too short", None, None),
+    'state': (2, "State too short", None, None),
+    # Allow alphanumeric for international ZIP codes
+    'zip_code': (
+        3, "ZIP code must be at least 3 characters",
+        re.compile(r"^[A-Za-z0-9 \-]+$"), "ZIP code can only contain letters, numbers, and hyphens",
+    ),
+}
+
+# -------------------------
+# Message Templates
+# -------------------------
+PAYMENT_TEMPLATE = string.Template(
+    "💰 Payment Request\n\n"
+    "$items\n\n"
+    "💰 Total Amount: $total\n\n"
+    "$shipping\n\n"
+    "📋 Instructions:\n"
+    "1. Scan the QR code or copy the payment request\n"
+    "2. Use a Monero wallet that supports payment requests\n"
+    "3. Click \"Check Payment\" after sending\n"
+    "4. Your order will be shipped after confirmation\n\n"
+    "⏰ Payment expires in 30 minutes"
+)
+
+# -------------------------
+# QR Code Helper
+# -------------------------
+@lru_cache(maxsize=256)
+def render_qr_png(payment_request: str) -> bytes:
+    """Render a payment request as a compact PNG QR code (cached per request string)"""
+    qr = qrcode.QRCode(
+        version=None,
+        box_size=4,
+        border=2,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+    )
+    qr.add_data(payment_request)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    bio = io.BytesIO()
+    img.save(bio, "PNG")
+    return bio.getvalue()
+
 # -------------------------
 # MoneroBot class
 # -------------------------
@@ -85,7 +185,30 @@ class MoneroBot:
         self.monero = MoneroHandler()
         self.user_states: Dict[int, Dict[str, Any]] = {}
         self._is_running = False
-        self._checkout_lock: set[int] = set()
+        # Per-user checkout locks with the last time each was handed out
+        self._checkout_locks: Dict[int, asyncio.Lock] = {}
+        self._checkout_lock_used: Dict[int, float] = {}
+        # Per-chat job queues: jobs run in order within a chat, chats run concurrently
+        self._chat_queues: Dict[int, asyncio.Queue] = {}
+        self._chat_workers: Dict[int, asyncio.Task] = {}
+        # telegram_id -> users.id for users known to exist in the users table
+        self._user_ids = BoundedLRU(maxsize=100_000)
+        # callback_data is "<op>" or "<op>:<arg>"; handlers take (update, context, arg)
+        self._callback_dispatch = {
+            "show_products": lambda u, c, _: self._show_products_common(u),
+            "view_cart": lambda u, c, _: self.show_cart(u, c),
+            "my_orders": lambda u, c, _: self._show_orders_common(u),
+            "mo": lambda u, c, arg: self._show_orders_common(u, arg),
+            "clear_cart": lambda u, c, _: self.clear_cart(u, c),
+            "start_checkout": lambda u, c, _: self._start_checkout(u, c),
+            "atc": lambda u, c, arg: self._add_to_cart(u, c, int(arg)),
+            "pd": lambda u, c, arg: self._show_product_details(u, c, int(arg)),
+            "cp": lambda u, c, arg: self._check_payment(u, c, int(arg)),
+            "od": lambda u, c, arg: self._show_order_details(u, c, int(arg)),
+            "confirm_order_proceed": lambda u, c, _: self._create_order_from_cart(u, c),
+            "edit_shipping_info": lambda u, c, _: self._edit_shipping_info(u, c),
+            "cancel_order_confirmation": lambda u, c, _: self.cancel_operation(u, c),
+        }
 
     async def initialize(self):
         if self.application is None:
@@ -112,7 +235,7 @@ class MoneroBot:
         await self.initialize()
         await self.application.initialize()
         await self.application.start()
-        await self.application.bot.set_webhook(webhook_url)
+        await self.application.bot.set_webhook(webhook_url, secret_token=config.WEBHOOK_SECRET)
         self._is_running = True
         logger.info(f"Webhook set to: {webhook_url}")
 
@@ -125,6 +248,8 @@ class MoneroBot:
         logger.info("Bot started with polling")
 
     async def shutdown(self):
+        for worker in self._chat_workers.values():
+            worker.cancel()
         if self.application and self._is_running:
             if self.application.updater and self.application.updater.running:
                 await self.application.updater.stop()
@@ -132,6 +257,7 @@ class MoneroBot:
             await self.application.shutdown()
             self._is_running = False
             logger.info("Bot shutdown complete")
+        self.monero.close()
 
     async def error_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Update {update} caused error {context.error}", exc_info=True)
@@ -155,9 +281,53 @@ class MoneroBot:
             del self.user_states[user_id]
             logger.info(f"Cleared state for user {user_id}")
 
+    def _checkout_lock_for(self, user_id: int) -> asyncio.Lock:
+        self._checkout_lock_used[user_id] = time.time()
+        return self._checkout_locks.setdefault(user_id, asyncio.Lock())
+
+    def prune_checkout_locks(self, max_age: int = 1800):
+        """Drop idle checkout locks that have not been used for max_age seconds"""
+        cutoff = time.time() - max_age
+        for user_id, lock in list(self._checkout_locks.items()):
+            if not lock.locked() and self._checkout_lock_used.get(user_id, 0) < cutoff:
+                del self._checkout_locks[user_id]
+                self._checkout_lock_used.pop(user_id, None)
+
+    def _enqueue_for_chat(self, chat_id: int, job):
+        queue = self._chat_queues.get(chat_id)
+        if queue is None:
+            queue = self._chat_queues[chat_id] = asyncio.Queue()
+            self._chat_workers[chat_id] = asyncio.create_task(self._chat_worker(chat_id, queue))
+        queue.put_nowait(job)
+
+    async def _chat_worker(self, chat_id: int, queue: asyncio.Queue, idle_timeout: int = 300):
+        while True:
+            try:
+                job = await asyncio.wait_for(queue.get(), timeout=idle_timeout)
+            except asyncio.TimeoutError:
+                if queue.empty():
+                    del self._chat_queues[chat_id]
+                    del self._chat_workers[chat_id]
+                    return
+                continue
+            try:
+                await job()
+            except Exception as e:
+                logger.error(f"Queued job failed for chat {chat_id}: {e}", exc_info=True)
+            finally:
+                queue.task_done()
+
     def format_price_with_usd(self, xmr_amount: float) -> str:
-        usd_amount = XMRPrice.xmr_to_usd(xmr_amount)
-        return f"{xmr_amount:.6f} XMR (≈${usd_amount:.2f} USD)"
+        return _format_price_with_usd_cached(round(xmr_amount, 8), int(time.time() // 60))
+
+    def _cart_total(self, session, cart_id: int) -> float:
+        """Sum quantity * price for a cart in a single aggregate query"""
+        return session.query(
+            func.coalesce(func.sum(CartItem.quantity * Product.price_xmr), 0.0)
+        ).join(Product, Product.id == CartItem.product_id).filter(CartItem.cart_id == cart_id).scalar()
+
+    def _cart_item_count(self, session, cart_id: int) -> int:
+        return session.query(func.count(CartItem.id)).filter(CartItem.cart_id == cart_id).scalar()
 
     async def _safe_edit(self, query, text: str, reply_markup=None, **kwargs):
         try:
@@ -168,11 +338,17 @@ class MoneroBot:
                 return
             raise
 
+    async def _reply(self, update: Update, text: str, reply_markup=None, parse_mode=None):
+        """Reply to a command message, or edit the message behind a callback query"""
+        if update.message:
+            await update.message.reply_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        else:
+            await self._safe_edit(update.callback_query, text, reply_markup=reply_markup, parse_mode=parse_mode)
+
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user = update.effective_user
         await self._register_user(user)
         self.clear_user_state(user.id)
-        self._checkout_lock.discard(user.id)
 
         welcome_text = (
             "🌟 Welcome to Crypto Pharmacy Bot! 🌟\n\n"
@@ -196,10 +372,7 @@ class MoneroBot:
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
 
-        if update.message:
-            await update.message.reply_text(welcome_text, reply_markup=reply_markup)
-        else:
-            await self._safe_edit(update.callback_query, welcome_text, reply_markup=reply_markup)
+        await self._reply(update, welcome_text, reply_markup=reply_markup)
 
     async def debug_state(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Debug command to check user state"""
@@ -209,7 +382,7 @@ class MoneroBot:
         debug_info = f"User State Debug:\n"
         debug_info += f"User ID: {user_id}\n"
         debug_info += f"State: {user_state}\n"
-        debug_info += f"In checkout lock: {user_id in self._checkout_lock}\n"
+        debug_info += f"In checkout lock: {user_id in self._checkout_locks and self._checkout_locks[user_id].locked()}\n"
         
         with Session() as session:
             user = session.query(User).filter(User.telegram_id == user_id).first()
@@ -231,10 +404,7 @@ class MoneroBot:
             products = session.query(Product).filter(Product.is_available == True).all()
             if not products:
                 msg = "No products available at the moment."
-                if update.message:
-                    await update.message.reply_text(msg)
-                else:
-                    await self._safe_edit(update.callback_query, msg)
+                await self._reply(update, msg)
                 return
 
             text = "📋 Available Products:\n\n"
@@ -246,16 +416,13 @@ class MoneroBot:
                     text += f"📝 {p.description}\n"
                 text += "\n"
                 keyboard.append([
-                    InlineKeyboardButton(f"➕ Add {p.name}", callback_data=f"add_to_cart_{p.id}"),
-                    InlineKeyboardButton("🔍 Details", callback_data=f"product_details_{p.id}")
+                    InlineKeyboardButton(f"➕ Add {p.name}", callback_data=f"atc:{p.id}"),
+                    InlineKeyboardButton("🔍 Details", callback_data=f"pd:{p.id}")
                 ])
             keyboard.append([InlineKeyboardButton("🛒 View Cart", callback_data="view_cart")])
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            if update.message:
-                await update.message.reply_text(text, reply_markup=reply_markup)
-            else:
-                await self._safe_edit(update.callback_query, text, reply_markup=reply_markup)
+            await self._reply(update, text, reply_markup=reply_markup)
 
     async def show_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
@@ -263,20 +430,25 @@ class MoneroBot:
 
         with Session() as session:
             user = session.query(User).filter(User.telegram_id == user_id).first()
-            if not user or not user.cart or not user.cart.cart_items:
+            cart_items = []
+            if user and user.cart:
+                cart_items = (
+                    session.query(CartItem)
+                    .options(joinedload(CartItem.product))
+                    .filter(CartItem.cart_id == user.cart.id)
+                    .all()
+                )
+            if not cart_items:
                 msg = "🛒 Your cart is empty.\n\nUse /products to browse and add items."
-                if update.message:
-                    await update.message.reply_text(msg)
-                else:
-                    await self._safe_edit(update.callback_query, msg)
+                await self._reply(update, msg)
                 return
 
-            cart = user.cart
-            total = sum(item.product.price_xmr * item.quantity for item in cart.cart_items)
+            total = 0.0
             text = "🛒 Your Shopping Cart\n\n"
-            for item in cart.cart_items:
+            for item in cart_items:
                 p = item.product
                 subtotal = p.price_xmr * item.quantity
+                total += subtotal
                 text += f"{p.name}\n"
                 text += f"💎 {self.format_price_with_usd(p.price_xmr)} × {item.quantity} = {self.format_price_with_usd(subtotal)}\n\n"
             text += f"💰 Total: {self.format_price_with_usd(total)}\n\n"
@@ -288,10 +460,7 @@ class MoneroBot:
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            if update.message:
-                await update.message.reply_text(text, reply_markup=reply_markup)
-            else:
-                await self._safe_edit(update.callback_query, text, reply_markup=reply_markup)
+            await self._reply(update, text, reply_markup=reply_markup)
 
     async def clear_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
@@ -301,33 +470,44 @@ class MoneroBot:
                 session.delete(user.cart)
                 session.commit()
             msg = "🗑️ Your cart has been cleared."
-            if update.message:
-                await update.message.reply_text(msg)
-            else:
-                await self._safe_edit(update.callback_query, msg)
+            await self._reply(update, msg)
 
     async def show_orders(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         self.clear_user_state(update.effective_user.id)
         await self._show_orders_common(update)
 
-    async def _show_orders_common(self, update: Update):
+    async def _show_orders_common(self, update: Update, cursor: str = ""):
+        """List a user's orders newest first, paging with a (created_at, id) keyset cursor"""
         with Session() as session:
             user = session.query(User).filter(User.telegram_id == update.effective_user.id).first()
             if not user:
                 msg = "📦 You don't have any orders yet."
-                if update.message:
-                    await update.message.reply_text(msg)
-                else:
-                    await self._safe_edit(update.callback_query, msg)
+                await self._reply(update, msg)
                 return
 
-            orders = session.query(Order).filter(Order.user_id == user.id).order_by(Order.created_at.desc()).limit(10).all()
+            orders_query = (
+                session.query(Order)
+                .options(selectinload(Order.order_items), joinedload(Order.shipping_address))
+                .filter(Order.user_id == user.id)
+            )
+            if cursor:
+                cursor_ts, _, cursor_id = cursor.rpartition(",")
+                cursor_ts, cursor_id = datetime.fromisoformat(cursor_ts), int(cursor_id)
+                orders_query = orders_query.filter(or_(
+                    Order.created_at < cursor_ts,
+                    and_(Order.created_at == cursor_ts, Order.id < cursor_id),
+                ))
+            orders = (
+                orders_query
+                .order_by(Order.created_at.desc(), Order.id.desc())
+                .limit(ORDERS_PAGE_SIZE + 1)
+                .all()
+            )
+            has_more = len(orders) > ORDERS_PAGE_SIZE
+            orders = orders[:ORDERS_PAGE_SIZE]
             if not orders:
                 msg = "📦 You don't have any orders yet."
-                if update.message:
-                    await update.message.reply_text(msg)
-                else:
-                    await self._safe_edit(update.callback_query, msg)
+                await self._reply(update, msg)
                 return
 
             text = "📦 Your Recent Orders:\n\n"
@@ -342,26 +522,25 @@ class MoneroBot:
                     text += f"Shipping: {o.shipping_address.city}, {o.shipping_address.state}\n"
                 text += "\n"
 
-            keyboard = [
+            keyboard = []
+            if has_more:
+                last = orders[-1]
+                keyboard.append([InlineKeyboardButton(
+                    "⏭️ Older Orders", callback_data=f"mo:{last.created_at.isoformat()},{last.id}"
+                )])
+            keyboard += [
                 [InlineKeyboardButton("📋 Browse Products", callback_data="show_products")],
                 [InlineKeyboardButton("🛒 View Cart", callback_data="view_cart")],
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            if update.message:
-                await update.message.reply_text(text, reply_markup=reply_markup)
-            else:
-                await self._safe_edit(update.callback_query, text, reply_markup=reply_markup)
+            await self._reply(update, text, reply_markup=reply_markup)
 
     async def cancel_operation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
         self.clear_user_state(user_id)
-        self._checkout_lock.discard(user_id)
         msg = "❌ Operation cancelled. Use /start to begin again."
-        if update.message:
-            await update.message.reply_text(msg)
-        else:
-            await self._safe_edit(update.callback_query, msg)
+        await self._reply(update, msg)
 
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         query = update.callback_query
@@ -372,34 +551,15 @@ class MoneroBot:
             await query.answer("Too many requests. Try again later.")
             return
 
-        if data == "show_products":
-            await self._show_products_common(update)
-        elif data == "view_cart":
-            await self.show_cart(update, context)
-        elif data == "my_orders":
-            await self._show_orders_common(update)
-        elif data == "clear_cart":
-            await self.clear_cart(update, context)
-        elif data == "start_checkout":
-            await self._start_checkout(update, context)
-        elif data.startswith("add_to_cart_"):
-            product_id = int(data[len("add_to_cart_"):])
-            await self._add_to_cart(update, context, product_id)
-        elif data.startswith("product_details_"):
-            product_id = int(data[len("product_details_"):])
-            await self._show_product_details(update, context, product_id)
-        elif data.startswith("check_payment_"):
-            order_id = int(data[len("check_payment_"):])
-            await self._check_payment(update, context, order_id)
-        elif data.startswith("order_details_"):
-            order_id = int(data[len("order_details_"):])
-            await self._show_order_details(update, context, order_id)
-        elif data == "confirm_order_proceed":
-            await self._create_order_from_cart(update, context)
-        elif data == "edit_shipping_info":
-            await self._edit_shipping_info(update, context)
-        elif data == "cancel_order_confirmation":
-            await self.cancel_operation(update, context)
+        op, _, arg = data.partition(":")
+        handler = self._callback_dispatch.get(op)
+        if handler is None:
+            # Buttons sent before the short opcodes still carry "<name>_<id>"
+            prefix, _, arg = data.rpartition("_")
+            op = LEGACY_CALLBACK_OPS.get(prefix)
+            handler = self._callback_dispatch.get(op) if arg.isdigit() else None
+        if handler:
+            await handler(update, context, arg)
 
     async def _add_to_cart(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
         query = update.callback_query
@@ -420,9 +580,9 @@ class MoneroBot:
                 session.add(user)
                 session.flush()  # Flush to get the user ID
             
-            # Now get the product
-            product = session.query(Product).filter(Product.id == product_id).first()
-            if not product:
+            # Now get the product name
+            product_name = session.query(Product.name).filter(Product.id == product_id).scalar()
+            if product_name is None:
                 await query.answer("Product not found")
                 return
             
@@ -432,19 +592,16 @@ class MoneroBot:
                 session.add(user.cart)
                 session.flush()
             
-            # Add item to cart
-            existing = session.query(CartItem).filter(
-                CartItem.cart_id == user.cart.id, 
-                CartItem.product_id == product_id
-            ).first()
-            
-            if existing:
-                existing.quantity += 1
-            else:
-                session.add(CartItem(cart_id=user.cart.id, product_id=product_id, quantity=1))
+            # Add item to cart, bumping the quantity if it is already there
+            stmt = dialect_insert(CartItem).values(cart_id=user.cart.id, product_id=product_id, quantity=1)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['cart_id', 'product_id'],
+                set_={'quantity': CartItem.__table__.c.quantity + 1},
+            )
+            session.execute(stmt)
             
             session.commit()
-            await query.answer(f"✅ {product.name} added to cart!")
+            await query.answer(f"✅ {product_name} added to cart!")
 
     async def _show_product_details(self, update: Update, context: ContextTypes.DEFAULT_TYPE, product_id: int):
         query = update.callback_query
@@ -459,7 +616,7 @@ class MoneroBot:
                 text += f"📝 Description: {product.description}\n\n"
             text += "Available for one-time purchase."
             keyboard = [
-                [InlineKeyboardButton("➕ Add to Cart", callback_data=f"add_to_cart_{product.id}")],
+                [InlineKeyboardButton("➕ Add to Cart", callback_data=f"atc:{product.id}")],
                 [InlineKeyboardButton("⬅️ Back to Products", callback_data="show_products")],
             ]
             await self._safe_edit(query, text, reply_markup=InlineKeyboardMarkup(keyboard))
@@ -468,54 +625,47 @@ class MoneroBot:
         query = update.callback_query
         user_id = query.from_user.id
 
-        if user_id in self._checkout_lock:
+        lock = self._checkout_lock_for(user_id)
+        if lock.locked():
             await query.answer("Checkout already in progress")
             return
-        self._checkout_lock.add(user_id)
 
-        with Session() as session:
-            user = session.query(User).filter(User.telegram_id == user_id).first()
-            if not user or not user.cart or not user.cart.cart_items:
-                await query.answer("Your cart is empty")
-                self._checkout_lock.discard(user_id)
-                return
+        async with lock:
+            with Session() as session:
+                user = session.query(User).filter(User.telegram_id == user_id).first()
+                item_count = self._cart_item_count(session, user.cart.id) if user and user.cart else 0
+                if not item_count:
+                    await query.answer("Your cart is empty")
+                    return
 
-            cart = user.cart
-            total_amount = sum(item.product.price_xmr * item.quantity for item in cart.cart_items)
+                total_amount = self._cart_total(session, user.cart.id)
 
-            user_state = self.get_user_state(user_id)
-            user_state.update({
-                'checkout_flow': True,
-                'current_step': 'full_name'
-            })
+                user_state = self.get_user_state(user_id)
+                user_state.update({
+                    'checkout_flow': True,
+                    'current_step': 'full_name'
+                })
 
-            await self._safe_edit(
-                query,
-                f"🚀 Proceeding to Checkout\n\n"
-                f"💰 Cart Total: {self.format_price_with_usd(total_amount)}\n"
-                f"📦 Items: {len(cart.cart_items)}\n\n"
-                "Please provide your shipping information:\n\n"
-                "Step 1 of 6: Full Name\n"
-                "Please enter your full name:"
-            )
+                await self._safe_edit(
+                    query,
+                    f"🚀 Proceeding to Checkout\n\n"
+                    f"💰 Cart Total: {self.format_price_with_usd(total_amount)}\n"
+                    f"📦 Items: {item_count}\n\n"
+                    "Please provide your shipping information:\n\n"
+                    "Step 1 of 6: Full Name\n"
+                    "Please enter your full name:"
+                )
 
     def _validate_input(self, step: str, value: str) -> tuple[bool, str]:
+        validator = SHIPPING_VALIDATORS.get(step)
+        if validator is None:
+            return True, ""
         value = value.strip()
-        if step == 'full_name' and len(value) < 3:
-            return False, "Full name must be at least 3 characters"
-        if step == 'street_address' and len(value) < 5:
-            return False, "Street address too short"
-        if step == 'city' and len(value) < 2:
-            return False, "City too short"
-        if step == 'state' and len(value) < 2:
-            return False, "State too short"
-        if step == 'zip_code':
-            # More flexible ZIP code validation
-            if not value or len(value) < 3:
-                return False, "ZIP code must be at least 3 characters"
-            # Allow alphanumeric for international ZIP codes
-            if not value.replace(' ', '').replace('-', '').isalnum():
-                return False, "ZIP code can only contain letters, numbers, and hyphens"
+        min_len, length_error, pattern, pattern_error = validator
+        if len(value) < min_len:
+            return False, length_error
+        if pattern and not pattern.match(value):
+            return False, pattern_error
         return True, ""
 
     async def _collect_shipping_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -579,7 +729,6 @@ class MoneroBot:
                     logger.error(error_msg)
                     await update.message.reply_text(error_msg)
                     self.clear_user_state(user_id)
-                    self._checkout_lock.discard(user_id)
                     return
 
                 cart = user.cart
@@ -643,7 +792,6 @@ Please review your order above. Once confirmed, you'll receive payment instructi
                 "❌ An error occurred while preparing your order. Please try again or contact support."
             )
             self.clear_user_state(user_id)
-            self._checkout_lock.discard(user_id)
 
     async def _edit_shipping_info(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Allow user to edit shipping information"""
@@ -670,145 +818,169 @@ Please review your order above. Once confirmed, you'll receive payment instructi
         user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
         user_state = self.get_user_state(user_id)
 
-        try:
-            logger.info(f"Creating order for user {user_id}")
-            
-            with Session() as session:
-                user = session.query(User).filter(User.telegram_id == user_id).first()
-                if not user or not user.cart or not user.cart.cart_items:
-                    error_msg = "Error: Your cart is empty or user not found."
-                    logger.error(error_msg)
-                    if update.message:
-                        await update.message.reply_text(error_msg)
-                    else:
-                        await update.callback_query.message.reply_text(error_msg)
-                    self.clear_user_state(user_id)
-                    self._checkout_lock.discard(user_id)
-                    return
+        # Guard against a double tap on "Confirm Order" creating two orders
+        lock = self._checkout_lock_for(user_id)
+        if lock.locked():
+            if update.callback_query:
+                await update.callback_query.answer("Order is already being created")
+            return
 
-                cart = user.cart
-                total_amount = sum(item.product.price_xmr * item.quantity for item in cart.cart_items)
+        async with lock:
+            try:
+                logger.info(f"Creating order for user {user_id}")
+            
+                with Session() as session:
+                    user = session.query(User).filter(User.telegram_id == user_id).first()
+                    cart_items = []
+                    if user and user.cart:
+                        cart_items = (
+                            session.query(CartItem)
+                            .options(joinedload(CartItem.product))
+                            .filter(CartItem.cart_id == user.cart.id)
+                            .all()
+                        )
+                    if not cart_items:
+                        error_msg = "Error: Your cart is empty or user not found."
+                        logger.error(error_msg)
+                        if update.message:
+                            await update.message.reply_text(error_msg)
+                        else:
+                            await update.callback_query.message.reply_text(error_msg)
+                        self.clear_user_state(user_id)
+                        return
+
+                    cart = user.cart
+                    # The rows are needed for the order items anyway, so total them here
+                    total_amount = 0.0
+                    order_items = []
+                    for cart_item in cart_items:
+                        price_xmr = cart_item.product.price_xmr
+                        total_amount += price_xmr * cart_item.quantity
+                        order_items.append(OrderItem(
+                            product_id=cart_item.product_id,
+                            quantity=cart_item.quantity,
+                            price_xmr=price_xmr
+                        ))
+
+                    # Use shipping info from user state
+                    shipping_info = user_state.get('shipping_info', {})
+                    shipping_address = ShippingAddress(
+                        full_name=shipping_info['full_name'],
+                        street_address=shipping_info['street_address'],
+                        apt_number=shipping_info.get('apt_number'),
+                        city=shipping_info['city'],
+                        state=shipping_info['state'],
+                        zip_code=shipping_info['zip_code']
+                    )
 
-                # Use shipping info from user state
-                shipping_info = user_state.get('shipping_info', {})
-                shipping_address = ShippingAddress(
-                    full_name=shipping_info['full_name'],
-                    street_address=shipping_info['street_address'],
-                    apt_number=shipping_info.get('apt_number'),
-                    city=shipping_info['city'],
-                    state=shipping_info['state'],
-                    zip_code=shipping_info['zip_code']
-                )
-                session.add(shipping_address)
-                session.flush()
+                    # End the read transaction before the wallet RPC so no pooled connection (or
+                    # SQLite lock) is held while other handlers run; nothing is written until it returns
+                    session.commit()
+                    payment_data = await asyncio.to_thread(
+                        self.monero.create_payment_request, f"Order #{user.id}", total_amount
+                    )
+                    if not payment_data:
+                        error_msg = "Error generating payment. Please try again."
+                        if update.message:
+                            await update.message.reply_text(error_msg)
+                        else:
+                            await update.callback_query.message.reply_text(error_msg)
+                        self.clear_user_state(user_id)
+                        return
+
+                    session.add(shipping_address)
+                    session.flush()
+
+                    order = Order(
+                        user_id=user.id,
+                        total_amount_xmr=total_amount,
+                        payment_address=payment_data.get("integrated_address"),
+                        payment_id=payment_data.get("payment_id"),
+                        payment_request=payment_data.get("payment_request"),
+                        shipping_address_id=shipping_address.id,
+                        expires_at=datetime.utcnow() + timedelta(minutes=30),
+                        order_items=order_items
+                    )
+                    session.add(order)
+                    session.flush()
 
-                payment_data = self.monero.create_payment_request(f"Order #{user.id}", total_amount)
-                if not payment_data:
-                    error_msg = "Error generating payment. Please try again."
-                    if update.message:
-                        await update.message.reply_text(error_msg)
-                    else:
-                        await update.callback_query.message.reply_text(error_msg)
-                    self.clear_user_state(user_id)
-                    self._checkout_lock.discard(user_id)
-                    return
+                    # Render the QR code in a worker thread while the order is committed
+                    qr_task = asyncio.create_task(
+                        asyncio.to_thread(render_qr_png, payment_data.get("payment_request"))
+                    )
 
-                order = Order(
-                    user_id=user.id,
-                    total_amount_xmr=total_amount,
-                    payment_address=payment_data.get("integrated_address"),
-                    payment_id=payment_data.get("payment_id"),
-                    payment_request=payment_data.get("payment_request"),
-                    shipping_address_id=shipping_address.id,
-                    expires_at=datetime.utcnow() + timedelta(minutes=30)
-                )
-                session.add(order)
-                session.flush()
+                    session.delete(cart)
+                    session.commit()
 
-                for cart_item in cart.cart_items:
-                    session.add(OrderItem(
-                        order_id=order.id,
-                        product_id=cart_item.product_id,
-                        quantity=cart_item.quantity,
-                        price_xmr=cart_item.product.price_xmr
-                    ))
+                    bio = io.BytesIO(await qr_task)
 
-                session.delete(cart)
-                session.commit()
+                    shipping_summary = (
+                        f"📦 Shipping to:\n"
+                        f"{shipping_address.full_name}\n"
+                        f"{shipping_address.street_address}\n"
+                    )
+                    if shipping_address.apt_number:
+                        shipping_summary += f"Apt/Unit: {shipping_address.apt_number}\n"
+                    shipping_summary += f"{shipping_address.city}, {shipping_address.state} {shipping_address.zip_code}"
 
-                # Generate QR code and send payment instructions
-                qr = qrcode.QRCode(version=1, box_size=8, border=4)
-                qr.add_data(payment_data.get("payment_request"))
-                qr.make(fit=True)
-                img = qr.make_image(fill_color="black", back_color="white")
-                bio = io.BytesIO()
-                img.save(bio, "PNG")
-                bio.seek(0)
-
-                shipping_summary = (
-                    f"📦 Shipping to:\n"
-                    f"{shipping_address.full_name}\n"
-                    f"{shipping_address.street_address}\n"
-                )
-                if shipping_address.apt_number:
-                    shipping_summary += f"Apt/Unit: {shipping_address.apt_number}\n"
-                shipping_summary += f"{shipping_address.city}, {shipping_address.state} {shipping_address.zip_code}"
-
-                order_summary = ""
-                for item in order.order_items:
-                    order_summary += f"• {item.product.name} × {item.quantity} = {self.format_price_with_usd(item.price_xmr * item.quantity)}\n"
-
-                payment_text = (
-                    f"💰 Payment Request\n\n"
-                    f"{order_summary}\n"
-                    f"💰 Total Amount: {self.format_price_with_usd(total_amount)}\n\n"
-                    f"{shipping_summary}\n\n"
-                    "📋 Instructions:\n"
-                    "1. Scan the QR code or copy the payment request\n"
-                    "2. Use a Monero wallet that supports payment requests\n"
-                    "3. Click \"Check Payment\" after sending\n"
-                    "4. Your order will be shipped after confirmation\n\n"
-                    "⏰ Payment expires in 30 minutes"
-                )
+                    items_text = "\n".join(
+                        f"• {item.product.name} × {item.quantity} = {self.format_price_with_usd(item.product.price_xmr * item.quantity)}"
+                        for item in cart_items
+                    )
+                    payment_text = PAYMENT_TEMPLATE.substitute(
+                        items=items_text,
+                        total=self.format_price_with_usd(total_amount),
+                        shipping=shipping_summary,
+                    )
 
-                keyboard = [
-                    [InlineKeyboardButton("🔍 Check Payment", callback_data=f"check_payment_{order.id}")],
-                    [InlineKeyboardButton("📦 Order Details", callback_data=f"order_details_{order.id}")],
-                    [InlineKeyboardButton("🛍️ Continue Shopping", callback_data="show_products")],
-                ]
+                    keyboard = [
+                        [InlineKeyboardButton("🔍 Check Payment", callback_data=f"cp:{order.id}")],
+                        [InlineKeyboardButton("📦 Order Details", callback_data=f"od:{order.id}")],
+                        [InlineKeyboardButton("🛍️ Continue Shopping", callback_data="show_products")],
+                    ]
                 
+                    if update.message:
+                        await update.message.reply_photo(
+                            photo=bio,
+                            caption=payment_text,
+                            reply_markup=InlineKeyboardMarkup(keyboard)
+                        )
+                    else:
+                        # If coming from callback query, edit the existing message
+                        await update.callback_query.message.reply_photo(
+                            photo=bio,
+                            caption=payment_text,
+                            reply_markup=InlineKeyboardMarkup(keyboard)
+                        )
+
+                    logger.info(f"Order #{order.id} created successfully for user {user_id}")
+                    self.clear_user_state(user_id)
+
+            except Exception as e:
+                logger.error(f"Error creating order for user {user_id}: {e}", exc_info=True)
+                error_msg = "❌ An error occurred while creating your order. Please try again or contact support."
                 if update.message:
-                    await update.message.reply_photo(
-                        photo=bio,
-                        caption=payment_text,
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
+                    await update.message.reply_text(error_msg)
                 else:
-                    # If coming from callback query, edit the existing message
-                    await update.callback_query.message.reply_photo(
-                        photo=bio,
-                        caption=payment_text,
-                        reply_markup=InlineKeyboardMarkup(keyboard)
-                    )
-
-                logger.info(f"Order #{order.id} created successfully for user {user_id}")
+                    await update.callback_query.message.reply_text(error_msg)
                 self.clear_user_state(user_id)
-                self._checkout_lock.discard(user_id)
-
-        except Exception as e:
-            logger.error(f"Error creating order for user {user_id}: {e}", exc_info=True)
-            error_msg = "❌ An error occurred while creating your order. Please try again or contact support."
-            if update.message:
-                await update.message.reply_text(error_msg)
-            else:
-                await update.callback_query.message.reply_text(error_msg)
-            self.clear_user_state(user_id)
-            self._checkout_lock.discard(user_id)
 
     async def _check_payment(self, update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int):
+        # The callback is already answered; do the RPC + DB work on this chat's queue
         query = update.callback_query
+        chat_id = query.message.chat_id if query.message else query.from_user.id
+        self._enqueue_for_chat(chat_id, partial(self._do_check_payment, query, order_id))
+
+    async def _do_check_payment(self, query, order_id: int):
+        # Short read session; the order and what the messages show are loaded eagerly and
+        # stay usable after it closes
         with Session() as session:
-            order = session.query(Order).filter(Order.id == order_id).first()
+            order = (
+                session.query(Order)
+                .options(*ORDER_DETAIL_LOAD)
+                .filter(Order.id == order_id)
+                .first()
+            )
             if not order:
                 await query.answer("Order not found")
                 return
@@ -819,96 +991,136 @@ Please review your order above. Once confirmed, you'll receive payment instructi
                 await self._safe_edit(query, "❌ Payment expired. Please create a new order.")
                 return
 
-            payment_info = self.monero.check_payment(order.payment_id, order.total_amount_xmr)
-            if payment_info and payment_info.get("confirmations", 0) >= getattr(config, "CONFIRMATIONS_REQUIRED", 10):
-                order.status = "confirmed"
-                order.confirmed_at = datetime.utcnow()
+        # Wallet RPC is blocking I/O; run it off the event loop so other updates keep flowing,
+        # and with no session open so it doesn't hold a pooled connection
+        payment_info = await asyncio.to_thread(
+            self.monero.check_payment, order.payment_id, order.total_amount_xmr
+        )
+        if payment_info and payment_info.get("confirmations", 0) >= getattr(config, "CONFIRMATIONS_REQUIRED", 10):
+            confirmed_at = datetime.utcnow()
+            with Session() as session:
+                session.execute(
+                    sql_update(Order)
+                    .where(Order.id == order_id)
+                    .values(status="confirmed", confirmed_at=confirmed_at)
+                )
                 session.add(Payment(
-                    order_id=order.id,
+                    order_id=order_id,
                     tx_hash=payment_info.get("tx_hash"),
                     amount_xmr=float(payment_info.get("amount", 0.0)),
                     confirmations=payment_info.get("confirmations", 0),
                 ))
                 session.commit()
+            self.monero.invalidate_payment_cache(order.payment_id)
 
-                items_summary = "📦 Order Items:\n"
-                for item in order.order_items:
-                    items_summary += f"• {item.product.name} × {item.quantity}\n"
+            items_summary = "\n".join(
+                ["📦 Order Items:"] + [f"• {item.product.name} × {item.quantity}" for item in order.order_items]
+            ) + "\n"
 
-                shipping_info = ""
-                if order.shipping_address:
-                    a = order.shipping_address
-                    shipping_info = f"\n📦 Shipping Address:\n{a.full_name}\n{a.street_address}\n"
-                    if a.apt_number:
-                        shipping_info += f"{a.apt_number}\n"
-                    shipping_info += f"{a.city}, {a.state} {a.zip_code}"
+            shipping_info = ""
+            if order.shipping_address:
+                shipping_info = "\n" + "\n".join(["📦 Shipping Address:", *self._address_lines(order.shipping_address)])
 
-                await self._safe_edit(
-                    query,
-                    f"✅ Payment Confirmed!\n\n"
-                    f"📦 Order # {order.id}\n"
-                    f"🔗 Transaction: {payment_info.get('tx_hash')}\n"
-                    f"✅ Confirmations: {payment_info.get('confirmations')}\n"
-                    f"💰 Amount: {self.format_price_with_usd(payment_info.get('amount', 0.0))}\n"
-                    f"{items_summary}\n{shipping_info}\n\n"
-                    "Your order will be shipped soon!"
-                )
-            elif payment_info:
-                await self._safe_edit(
-                    query,
-                    f"⏳ Payment Received - Pending\n\n"
-                    f"📦 Order # {order.id}\n"
-                    f"💰 Amount: {self.format_price_with_usd(payment_info.get('amount', 0.0))}\n"
-                    f"🔗 Tx: {payment_info.get('tx_hash')}\n"
-                    f"✅ Confirmations: {payment_info.get('confirmations', 0)}/{getattr(config, 'CONFIRMATIONS_REQUIRED', 10)}\n\n"
-                    "Waiting for confirmations...",
-                    reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Check Again", callback_data=f"check_payment_{order.id}")]])
-                )
-            else:
-                await query.answer("No payment received yet.")
+            await self._safe_edit(
+                query,
+                f"✅ Payment Confirmed!\n\n"
+                f"📦 Order # {order.id}\n"
+                f"🔗 Transaction: {payment_info.get('tx_hash')}\n"
+                f"✅ Confirmations: {payment_info.get('confirmations')}\n"
+                f"💰 Amount: {self.format_price_with_usd(payment_info.get('amount', 0.0))}\n"
+                f"{items_summary}\n{shipping_info}\n\n"
+                "Your order will be shipped soon!"
+            )
+        elif payment_info:
+            await self._safe_edit(
+                query,
+                f"⏳ Payment Received - Pending\n\n"
+                f"📦 Order # {order.id}\n"
+                f"💰 Amount: {self.format_price_with_usd(payment_info.get('amount', 0.0))}\n"
+                f"🔗 Tx: {payment_info.get('tx_hash')}\n"
+                f"✅ Confirmations: {payment_info.get('confirmations', 0)}/{getattr(config, 'CONFIRMATIONS_REQUIRED', 10)}\n\n"
+                "Waiting for confirmations...",
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔄 Check Again", callback_data=f"cp:{order.id}")]])
+            )
+        else:
+            await query.answer("No payment received yet.")
+
+    @staticmethod
+    def _address_lines(a: ShippingAddress) -> list:
+        lines = [a.full_name, a.street_address]
+        if a.apt_number:
+            lines.append(a.apt_number)
+        lines.append(f"{a.city}, {a.state} {a.zip_code}")
+        return lines
 
     async def _show_order_details(self, update: Update, context: ContextTypes.DEFAULT_TYPE, order_id: int):
         query = update.callback_query
         with Session() as session:
-            order = session.query(Order).filter(Order.id == order_id).first()
+            order = (
+                session.query(Order)
+                .options(*ORDER_DETAIL_LOAD)
+                .filter(Order.id == order_id)
+                .first()
+            )
             if not order:
                 await query.answer("Order not found")
                 return
-            text = f"📦 Order #{order.id}\n\n"
-            text += f"📊 Status: {order.status.capitalize()}\n"
-            text += f"💰 Total: {self.format_price_with_usd(order.total_amount_xmr)}\n"
-            text += f"📅 Created: {order.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-            text += f"⏰ Expires: {order.expires_at.strftime('%Y-%m-%d %H:%M')}\n\n"
-            text += "📦 Items:\n"
-            for item in order.order_items:
-                text += f"• {item.product.name} × {item.quantity} = {self.format_price_with_usd(item.price_xmr * item.quantity)}\n"
-            text += f"\n📦 Shipping Address:\n"
+            parts = [
+                f"📦 Order #{order.id}",
+                "",
+                f"📊 Status: {order.status.capitalize()}",
+                f"💰 Total: {self.format_price_with_usd(order.total_amount_xmr)}",
+                f"📅 Created: {order.created_at.strftime('%Y-%m-%d %H:%M')}",
+                f"⏰ Expires: {order.expires_at.strftime('%Y-%m-%d %H:%M')}",
+                "",
+                "📦 Items:",
+            ]
+            parts.extend(
+                f"• {item.product.name} × {item.quantity} = {self.format_price_with_usd(item.price_xmr * item.quantity)}"
+                for item in order.order_items
+            )
+            parts += ["", "📦 Shipping Address:"]
             if order.shipping_address:
-                a = order.shipping_address
-                text += f"{a.full_name}\n{a.street_address}\n"
-                if a.apt_number:
-                    text += f"{a.apt_number}\n"
-                text += f"{a.city}, {a.state} {a.zip_code}\n"
+                parts.extend(self._address_lines(order.shipping_address))
+            text = "\n".join(parts) + "\n"
             keyboard = [
-                [InlineKeyboardButton("🔍 Check Payment", callback_data=f"check_payment_{order.id}")],
+                [InlineKeyboardButton("🔍 Check Payment", callback_data=f"cp:{order.id}")],
                 [InlineKeyboardButton("📦 All Orders", callback_data="my_orders")],
             ]
             await self._safe_edit(query, text, reply_markup=InlineKeyboardMarkup(keyboard))
 
-    async def _register_user(self, telegram_user):
+    async def _register_user(self, telegram_user) -> int:
+        """Insert the user if missing (race-free upsert) and return their users.id"""
+        user_id = self._user_ids.get(telegram_user.id)
+        if user_id is not None:
+            return user_id
         with Session() as session:
-            user = session.query(User).filter(User.telegram_id == telegram_user.id).first()
-            if not user:
-                user = User(
+            stmt = (
+                dialect_insert(User)
+                .values(
                     telegram_id=telegram_user.id,
                     username=telegram_user.username,
                     first_name=telegram_user.first_name,
                     last_name=telegram_user.last_name,
                     created_at=datetime.utcnow(),
                 )
-                session.add(user)
-                session.commit()
-            return user
+                .on_conflict_do_nothing(index_elements=['telegram_id'])
+                .returning(User.id)
+            )
+            user_id = session.execute(stmt).scalar()
+            session.commit()
+            if user_id is None:
+                user_id = session.query(User.id).filter(User.telegram_id == telegram_user.id).scalar()
+        self._user_ids[telegram_user.id] = user_id
+        return user_id
+
+    def warm_user_cache(self, chunk_size: int = 1000):
+        """Preload known Telegram ids so repeated /start skips the database"""
+        with Session() as session:
+            rows = session.query(User.telegram_id, User.id).limit(self._user_ids.maxsize).yield_per(chunk_size)
+            for telegram_id, user_id in rows:
+                self._user_ids[telegram_id] = user_id
+        logger.info(f"Warmed user cache with {len(self._user_ids)} users")
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
@@ -924,43 +1136,65 @@ Please review your order above. Once confirmed, you'll receive payment instructi
 # -------------------------
 # Background Job: Expire Orders
 # -------------------------
+EXPIRE_BATCH_SIZE = 500
+EXPIRE_LOCK_KEY = 72_410_002  # Postgres advisory lock key for the expiry job
+
 async def expire_old_orders(context: ContextTypes.DEFAULT_TYPE):
     """Fixed function with context parameter"""
     try:
         logger.info("Running expire_old_orders job")
         with Session() as session:
-            expired = session.query(Order).filter(
-                Order.status == "pending",
-                Order.expires_at < datetime.utcnow()
-            ).all()
-            for o in expired:
-                o.status = "expired"
-            if expired:
-                session.commit()
-                logger.info(f"Expired {len(expired)} orders.")
+            if session.bind.dialect.name == "postgresql":
+                # Only one worker expires orders at a time; released when the transaction ends
+                locked = session.execute(
+                    text("SELECT pg_try_advisory_xact_lock(:k)"), {"k": EXPIRE_LOCK_KEY}
+                ).scalar()
+                if not locked:
+                    return
+            batch = (
+                select(Order.id)
+                .where(Order.status == "pending", Order.expires_at < datetime.utcnow())
+                .limit(EXPIRE_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            result = session.execute(
+                sql_update(Order)
+                .where(Order.id.in_(batch.scalar_subquery()))
+                .values(status="expired")
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            if result.rowcount:
+                logger.info(f"Expired {result.rowcount} orders.")
+        # A full batch means there may be more; drain without waiting for the next interval
+        if result.rowcount >= EXPIRE_BATCH_SIZE and context and context.job_queue:
+            context.job_queue.run_once(expire_old_orders, when=0)
     except Exception as e:
         logger.error(f"Error in expire_old_orders: {e}")
 
+async def prune_checkout_locks(context: ContextTypes.DEFAULT_TYPE):
+    bot.prune_checkout_locks()
+
 # -------------------------
 # Bot Instance
 # -------------------------
 bot = MoneroBot()
 
 def seed_products():
-    with Session() as session:
+    with Session() as session, session.begin():
         if session.query(Product).count() == 0:
             products = [
-                Product(name="100ug Fluloprazolam Sheets", description="High quality research chemical", price_xmr=0.0035, is_available=True),
-                Product(name="250ug Fluloprazolam Sheets", description="Premium research chemical", price_xmr=0.0070, is_available=True),
-                Product(name="Dermorphin 5mg Vials", description="Pharmaceutical grade", price_xmr=0.0035, is_available=True),
-                Product(name="100ct Adderall", description="Pharmaceutical grade", price_xmr=0.0070, is_available=True),
-                Product(name="Tadalafil Powder 1g", description="High purity", price_xmr=0.0035, is_available=True),
-                Product(name="100mg Fluloprazolam Powder", description="Research chemical", price_xmr=0.0140, is_available=True),
-                Product(name="Bromnordiazepam 1g", description="Research chemical", price_xmr=0.0140, is_available=True),
-                Product(name="Promethazine Clearance 33.8g", description="Clearance sale", price_xmr=0.0220, is_available=True),
+                dict(name="100ug Fluloprazolam Sheets", description="High quality research chemical", price_xmr=0.0035, is_available=True),
+                dict(name="250ug Fluloprazolam Sheets", description="Premium research chemical", price_xmr=0.0070, is_available=True),
+                dict(name="Dermorphin 5mg Vials", description="Pharmaceutical grade", price_xmr=0.0035, is_available=True),
+                dict(name="100ct Adderall", description="Pharmaceutical grade", price_xmr=0.0070, is_available=True),
+                dict(name="Tadalafil Powder 1g", description="High purity", price_xmr=0.0035, is_available=True),
+                dict(name="100mg Fluloprazolam Powder", description="Research chemical", price_xmr=0.0140, is_available=True),
+                dict(name="Bromnordiazepam 1g", description="Research chemical", price_xmr=0.0140, is_available=True),
+                dict(name="Promethazine Clearance 33.8g", description="Clearance sale", price_xmr=0.0220, is_available=True),
             ]
-            session.add_all(products)
-            session.commit()
+            # One multi-row INSERT instead of an ORM flush per product
+            session.execute(sql_insert(Product), products)
             logger.info("Seeded products.")
         else:
             logger.info("Products already exist.")
@@ -970,11 +1204,15 @@ def seed_products():
 # -------------------------
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    init_db()
     seed_products()
+    bot.warm_user_cache()
     port = int(os.getenv("PORT", 8000))
     webhook_url = os.getenv("WEBHOOK_URL")
 
     if webhook_url:
+        # WEBHOOK_URL is the public URL of the /webhook route; Telegram's secret token header
+        # authenticates each update and lets any replica behind a load balancer serve it
         logger.info("Starting in PRODUCTION mode with webhook")
         await bot.start_webhook(webhook_url)
     else:
@@ -988,6 +1226,11 @@ async def lifespan(app: FastAPI):
             interval=300, 
             first=10
         )
+        bot.application.job_queue.run_repeating(
+            prune_checkout_locks,
+            interval=600,
+            first=600
+        )
         logger.info("Expiry job scheduled successfully")
 
     logger.info("Bot initialized and ready!")
@@ -998,7 +1241,7 @@ async def lifespan(app: FastAPI):
 # -------------------------
 # FastAPI App
 # -------------------------
-app = FastAPI(title="Pharmacy Telegram Bot", lifespan=lifespan)
+app = FastAPI(title="Pharmacy Telegram Bot", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 @app.get("/")
 async def healthcheck():
@@ -1006,8 +1249,12 @@ async def healthcheck():
 
 @app.post("/webhook")
 async def webhook(request: Request):
+    # Compare bytes: compare_digest rejects non-ASCII str with TypeError
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode()
+    if not config.WEBHOOK_SECRET or not hmac.compare_digest(secret, config.WEBHOOK_SECRET.encode()):
+        raise HTTPException(status_code=403, detail="Invalid webhook token")
     try:
-        data = await request.json()
+        data = orjson.loads(await request.body())
         logger.info(f"WEBHOOK RECEIVED - Update ID: {data.get('update_id')}")
         update = Update.de_json(data, bot.application.bot)
         await bot.application.process_update(update)
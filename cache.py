@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class BoundedLRU:
+    """Thread-safe LRU mapping capped at maxsize entries, with an optional per-entry TTL in seconds"""
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at or None, value)
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._live(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                return default
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def __setitem__(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
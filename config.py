@@ -1,10 +1,13 @@
 import os
+import hashlib
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Bot Configuration
 BOT_TOKEN = os.getenv('BOT_TOKEN')
+# Sent by Telegram in X-Telegram-Bot-Api-Secret-Token; derived from the token so every replica agrees
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or (hashlib.sha256(BOT_TOKEN.encode()).hexdigest() if BOT_TOKEN else '')
 ADMIN_IDS = [int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id]
 
 # Monero Configuration
@@ -14,7 +17,17 @@ MONERO_WALLET_PASSWORD = os.getenv('MONERO_WALLET_PASSWORD', '')
 
 # Database
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///bot.db')
+# Connection pool for server databases (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 20))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 40))
+# Create missing tables/indexes at startup; disable when the schema is managed by migrations
+DB_AUTO_CREATE = os.getenv('DB_AUTO_CREATE', 'true').lower() in ('1', 'true', 'yes')
 
 # Bot Settings
 PAYMENT_TIMEOUT = 1800  # 30 minutes in seconds
-CONFIRMATIONS_REQUIRED = 10
\ No newline at end of file
+CONFIRMATIONS_REQUIRED = 10
+PAYMENT_CHECK_CACHE_TTL = 10  # seconds to reuse a wallet payment lookup
+STATUS_CACHE_TTL = 2  # seconds to reuse a built get_payment_status result
+HEIGHT_CACHE_TTL = 5  # seconds to reuse the wallet height (a block is ~2 minutes)
+CHAIN_WATCH_INTERVAL = 2  # seconds between daemon get_info polls while waiting for payments
+TRANSFERS_LOOKBACK_BLOCKS = int(os.getenv('TRANSFERS_LOOKBACK_BLOCKS', '0'))  # 0 = derive from PAYMENT_TIMEOUT
\ No newline at end of file
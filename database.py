@@ -1,12 +1,28 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey, Index
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
 import config
 
 Base = declarative_base()
-engine = create_engine(config.DATABASE_URL)
-Session = sessionmaker(bind=engine)
+
+def _create_engine():
+    if config.DATABASE_URL.startswith('sqlite'):
+        # SQLite has no server to pool against; allow sessions to hop threads
+        return create_engine(config.DATABASE_URL, connect_args={'check_same_thread': False})
+    return create_engine(
+        config.DATABASE_URL,
+        pool_size=config.DB_POOL_SIZE,
+        max_overflow=config.DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_timeout=10,
+    )
+
+engine = _create_engine()
+# Keep loaded attributes after commit so handlers can render results without re-SELECTs
+Session = sessionmaker(bind=engine, expire_on_commit=False)
 
 class User(Base):
     __tablename__ = 'users'
@@ -62,6 +78,9 @@ class Cart(Base):
 
 class CartItem(Base):
     __tablename__ = 'cart_items'
+    __table_args__ = (
+        Index('uq_cart_items_cart_product', 'cart_id', 'product_id', unique=True),
+    )
     id = Column(Integer, primary_key=True)
     cart_id = Column(Integer, ForeignKey('carts.id'), nullable=False)
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
@@ -74,12 +93,18 @@ class CartItem(Base):
 
 class Order(Base):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Equality column first, then the range column, for the expiry job
+        Index('ix_orders_status_expires_at', 'status', 'expires_at'),
+        # Serves per-user lookups and keyset pagination of a user's order history
+        Index('ix_orders_user_created', 'user_id', 'created_at'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     shipping_address_id = Column(Integer, ForeignKey('shipping_addresses.id'), nullable=False)
     total_amount_xmr = Column(Float, nullable=False)
-    payment_address = Column(String(255), nullable=False)
-    payment_id = Column(String(255))
+    payment_address = Column(String(106), nullable=False)  # Monero integrated address length
+    payment_id = Column(String(64), index=True)
     payment_request = Column(Text)
     status = Column(String(50), default='pending')
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -107,9 +132,12 @@ class OrderItem(Base):
 
 class Payment(Base):
     __tablename__ = 'payments'
+    __table_args__ = (
+        Index('ix_payments_order_id_created_at', 'order_id', 'created_at'),
+    )
     id = Column(Integer, primary_key=True)
     order_id = Column(Integer, ForeignKey('orders.id'), nullable=False)
-    tx_hash = Column(String(255))
+    tx_hash = Column(String(64), index=True)
     amount_xmr = Column(Float, nullable=False)
     confirmations = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
@@ -117,9 +145,49 @@ class Payment(Base):
     # Relationships
     order = relationship("Order", back_populates="payments")
 
+def dialect_insert(model):
+    """Return an INSERT construct supporting ON CONFLICT for the configured database"""
+    if engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+# Arbitrary key for the Postgres advisory lock serialising schema creation
+SCHEMA_LOCK_KEY = 72_410_001
+
+def _merge_duplicate_cart_items(conn):
+    """Fold duplicate (cart_id, product_id) rows into the oldest one so the unique index can build"""
+    conn.execute(text(
+        "UPDATE cart_items SET quantity = ("
+        " SELECT SUM(COALESCE(dup.quantity, 1)) FROM cart_items dup"
+        " WHERE dup.cart_id = cart_items.cart_id AND dup.product_id = cart_items.product_id"
+        ") WHERE id IN ("
+        " SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id HAVING COUNT(*) > 1"
+        ")"
+    ))
+    conn.execute(text(
+        "DELETE FROM cart_items WHERE id NOT IN ("
+        " SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM cart_items GROUP BY cart_id, product_id) AS keep"
+        ")"
+    ))
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    # Databases from before uq_cart_items_cart_product may hold duplicate rows it would reject
+    cart_indexes = {index['name'] for index in inspect(conn).get_indexes('cart_items')}
+    if 'uq_cart_items_cart_product' not in cart_indexes:
+        _merge_duplicate_cart_items(conn)
+    # create_all skips existing tables, so add indexes introduced after them
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
 # Create tables
 def init_db():
-    Base.metadata.create_all(engine)
-
-# Initialize database
-init_db()
\ No newline at end of file
+    if not config.DB_AUTO_CREATE:
+        return
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Workers take turns; the lock is held until this transaction commits, so the
+            # next worker sees the finished schema and its checkfirst pass is a no-op
+            conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": SCHEMA_LOCK_KEY})
+        _create_schema(conn)
@@ -1,28 +1,148 @@
-import requests
-import json
+import asyncio
+import importlib.util
+import httpx
+import orjson
 import time
 import logging
+import threading
+from functools import lru_cache
 from decimal import Decimal
 from datetime import datetime
 from typing import Dict, Optional, Any
 import config
+from cache import BoundedLRU
 from database import Session, Order, Payment
 
 # Import your Monero libraries
+from monero import base58
 from monerorequest import (
     make_random_payment_id, 
-    convert_datetime_object_to_truncated_RFC3339_timestamp_format,
     decode_monero_payment_request, 
     make_monero_payment_request
 )
 
 logger = logging.getLogger(__name__)
 
+# Atomic units per XMR, and the rounding slack allowed when matching a payment amount
+_PICONERO = Decimal(10) ** 12
+_TOLERANCE = Decimal("0.000001")
+
+# Entry caps for the per-handler caches
+PAYMENT_CACHE_SIZE = 2048
+STATUS_CACHE_SIZE = 2048
+ADDRESS_CACHE_SIZE = 1024
+
+_MISSING = object()
+
+# HTTP/2 needs the optional h2 package; without it httpx speaks HTTP/1.1 with keep-alive
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+def _rpc_request(method: str, params=None, request_id: str = "0") -> Dict[str, Any]:
+    """Build a JSON-RPC 2.0 request; parameterless calls leave out "params" entirely"""
+    request = {"jsonrpc": "2.0", "id": request_id, "method": method}
+    if params:
+        request["params"] = params
+    return request
+
+
+@lru_cache(maxsize=1024)
+def _decode_cached(payment_request_code: str):
+    """Decoding is a pure function of the code, so repeat lookups skip the Base58/CRC work"""
+    return decode_monero_payment_request(payment_request_code)
+
+
+@lru_cache(maxsize=4096)
+def _extract_payment_id(address: str) -> Optional[str]:
+    """Return the hex payment ID embedded in an integrated address, or None for other addresses"""
+    try:
+        decoded = base58.decode(address)
+    except Exception:
+        return None
+    # netbyte + spend key + view key + 8-byte payment ID + checksum = 77 bytes
+    if len(decoded) != 154:
+        return None
+    return decoded[130:146]
+
+
 class MoneroHandler:
     def __init__(self):
         self.rpc_url = config.MONERO_RPC_URL
         self.wallet_rpc_url = config.MONERO_WALLET_RPC_URL
+        # One keep-alive client per RPC endpoint (daemon / wallet), created lazily
+        self._clients: Dict[str, httpx.Client] = {}
+        self._clients_lock = threading.Lock()
+        # RPC URL -> whether the server answers JSON-RPC batch requests
+        self._batch_supported: Dict[str, bool] = {}
+        # (payment_id, expected_amount) -> check_payment result
+        self._payment_cache = BoundedLRU(PAYMENT_CACHE_SIZE, ttl=getattr(config, "PAYMENT_CHECK_CACHE_TTL", 10))
+        # order_id -> status_info, so bursts of get_payment_status share one build
+        self._status_cache = BoundedLRU(STATUS_CACHE_SIZE, ttl=getattr(config, "STATUS_CACHE_TTL", 2.0))
+        # (fetched_at, height) from the last get_height, shared by all payment checks
+        self._height_cache: Optional[tuple] = None
+        self._height_lock = threading.Lock()
+        self._height_ttl = getattr(config, "HEIGHT_CACHE_TTL", 5.0)
+        self.confirmations_required = getattr(config, "CONFIRMATIONS_REQUIRED", 10)
+        # Blocks of history get_transfers scans: twice the payment window at ~120 s per block
+        # (block times vary) plus the confirmations an order can still be waiting on
+        self._transfers_lookback = getattr(config, "TRANSFERS_LOOKBACK_BLOCKS", None) or (
+            2 * config.PAYMENT_TIMEOUT // 120 + self.confirmations_required
+        )
+        # address -> valid, for answers the wallet RPC actually gave
+        self._address_cache = BoundedLRU(ADDRESS_CACHE_SIZE)
+        # Background daemon watcher that wakes wait_for_payment() when the chain or pool changes
+        self._chain_changed = threading.Condition()
+        self._chain_generation = 0  # bumped on any tip or pool change
+        self._block_generation = 0  # bumped only when a new block arrives
+        self._chain_watch_ok = False
+        self._watch_interval = getattr(config, "CHAIN_WATCH_INTERVAL", 2.0)
+        self._watch_stop = threading.Event()
+        # Watcher thread and active wait_for_payment() calls, both guarded by _chain_changed
+        self._watcher: Optional[threading.Thread] = None
+        self._waiters = 0
         
+    def _client_for(self, url: str) -> httpx.Client:
+        """Return the pooled client for an RPC endpoint, creating it on first use"""
+        client = self._clients.get(url)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(url)
+                if client is None:
+                    client = httpx.Client(
+                        transport=httpx.HTTPTransport(
+                            http2=_HTTP2,
+                            retries=2,
+                            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8),
+                        ),
+                        headers={'Content-Type': 'application/json'},
+                        timeout=30.0,
+                    )
+                    self._clients[url] = client
+        return client
+
+    def close(self):
+        """Stop the chain watcher and close pooled RPC connections"""
+        self._watch_stop.set()
+        with self._clients_lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+    def _post(self, url: str, payload):
+        """POST a JSON-RPC payload and return the decoded response body"""
+        body = orjson.dumps(payload)
+        try:
+            response = self._client_for(url).post(url, content=body)
+            response.raise_for_status()
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
+            logger.error(f"Monero RPC request failed: {e}")
+            return None
+        try:
+            return orjson.loads(response.content)
+        except orjson.JSONDecodeError as e:
+            logger.error(f"Monero RPC JSON decode failed: {e}")
+            return None
+
     def rpc_call(self, method, params=None, wallet_rpc=False):
         """Make RPC call to Monero daemon or wallet"""
         url = self.wallet_rpc_url if wallet_rpc else self.rpc_url
@@ -31,55 +151,72 @@ class MoneroHandler:
             logger.error("Monero RPC URL not configured")
             return None
             
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "0",
-            "method": method,
-            "params": params or {}
-        }
-        
-        try:
-            response = requests.post(
-                url,
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            if 'error' in result and result['error']:
-                logger.error(f"Monero RPC error: {result['error']}")
-                return None
-                
-            return result.get('result')
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Monero RPC request failed: {e}")
+        result = self._post(url, _rpc_request(method, params))
+        if not isinstance(result, dict):
             return None
-        except json.JSONDecodeError as e:
-            logger.error(f"Monero RPC JSON decode failed: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error in RPC call: {e}")
+        if 'error' in result and result['error']:
+            logger.error(f"Monero RPC error: {result['error']}")
             return None
+            
+        return result.get('result')
+
+    def rpc_batch(self, calls, wallet_rpc=True) -> list:
+        """Make several RPC calls in one JSON-RPC 2.0 batch request.
+
+        Returns one result per call, in order (None for calls that failed). Falls back
+        to sequential calls when the server does not answer batches with a list.
+        """
+        url = self.wallet_rpc_url if wallet_rpc else self.rpc_url
+        if not url or self._batch_supported.get(url) is False:
+            return [self.rpc_call(method, params, wallet_rpc=wallet_rpc) for method, params in calls]
+
+        payload = [_rpc_request(method, params, str(i)) for i, (method, params) in enumerate(calls)]
+        response = self._post(url, payload)
+        if response is None:
+            # Transport failure: says nothing about batch support, don't cache it
+            return [None] * len(calls)
+        if not isinstance(response, list):
+            logger.info(f"Monero RPC at {url} does not support batch requests, using sequential calls")
+            self._batch_supported[url] = False
+            return [self.rpc_call(method, params, wallet_rpc=wallet_rpc) for method, params in calls]
+        self._batch_supported[url] = True
+
+        results = [None] * len(calls)
+        for item in response:
+            if not isinstance(item, dict):
+                continue
+            if item.get('error'):
+                logger.error(f"Monero RPC error: {item['error']}")
+                continue
+            try:
+                results[int(item.get('id'))] = item.get('result')
+            except (TypeError, ValueError, IndexError):
+                logger.error(f"Monero RPC batch returned unexpected id: {item.get('id')}")
+        return results
+
+    @staticmethod
+    def _rfc3339_now() -> str:
+        """Current time as the millisecond RFC 3339 stamp monerorequest produces for datetime.now()"""
+        return datetime.now().isoformat(timespec="milliseconds") + "Z"
+
+    def _new_integrated_address(self):
+        """Generate a payment ID and ask the wallet for its integrated address"""
+        payment_id = make_random_payment_id()
+        address_result = self.rpc_call(
+            "make_integrated_address", 
+            {"payment_id": payment_id},
+            wallet_rpc=True
+        )
+        
+        if not address_result:
+            raise Exception("Failed to create integrated address")
+            
+        return payment_id, address_result.get("integrated_address")
 
     def create_payment_request(self, order_description: str, total_amount_xmr: float) -> Dict[str, Any]:
         """Create a Monero payment request for one-time purchase"""
         try:
-            # Generate payment ID
-            payment_id = make_random_payment_id()
-            
-            # Create integrated address
-            address_result = self.rpc_call(
-                "make_integrated_address", 
-                {"payment_id": payment_id},
-                wallet_rpc=True
-            )
-            
-            if not address_result:
-                raise Exception("Failed to create integrated address")
-                
-            integrated_address = address_result.get("integrated_address")
+            payment_id, integrated_address = self._new_integrated_address()
             
             # Create payment request using your library
             payment_request = make_monero_payment_request(
@@ -88,7 +225,7 @@ class MoneroHandler:
                 currency="XMR",
                 amount=str(total_amount_xmr),
                 payment_id=payment_id,
-                start_date=convert_datetime_object_to_truncated_RFC3339_timestamp_format(datetime.now()),
+                start_date=self._rfc3339_now(),
                 number_of_payments=1,  # One-time payment only
                 version="2",  # Use V2 for better features
                 allow_standard=True,
@@ -116,62 +253,107 @@ class MoneroHandler:
             if payment_request_code.startswith("monero-request:"):
                 payment_request_code = payment_request_code.replace("monero-request:", "monero:")
             
-            return decode_monero_payment_request(payment_request_code)
+            decoded = _decode_cached(payment_request_code)
+            # Callers get their own copy so the cached dict can't be mutated
+            return dict(decoded) if isinstance(decoded, dict) else decoded
         except Exception as e:
             logger.error(f"Error decoding payment request: {e}")
             return None
 
     def check_payment(self, payment_id: str, expected_amount: float) -> Optional[Dict[str, Any]]:
+        """Check for payments using payment ID, reusing results for a few seconds"""
+        key = (payment_id, expected_amount)
+        cached = self._payment_cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+
+        result = self._check_payment_uncached(payment_id, expected_amount)
+        self._payment_cache[key] = result
+        return result
+
+    def invalidate_payment_cache(self, payment_id: str):
+        """Forget cached check_payment results for a payment ID"""
+        self._payment_cache.discard_where(lambda key: key[0] == payment_id)
+
+    def _cached_height(self) -> Optional[int]:
+        """Return the wallet height if it was fetched within the last HEIGHT_CACHE_TTL seconds"""
+        with self._height_lock:
+            cached = self._height_cache
+        if cached and time.monotonic() - cached[0] < self._height_ttl:
+            return cached[1]
+        return None
+
+    def _store_height(self, height: int) -> int:
+        with self._height_lock:
+            self._height_cache = (time.monotonic(), height)
+        return height
+
+    def _check_payment_uncached(self, payment_id: str, expected_amount: float) -> Optional[Dict[str, Any]]:
         """Check for payments using payment ID"""
         try:
-            # Get wallet height for confirmation calculation
-            wallet_height_result = self.rpc_call("get_height", wallet_rpc=True)
-            if not wallet_height_result:
-                return None
-                
-            wallet_height = wallet_height_result.get("height", 0)
-            
-            # Method 1: Check using get_payments (more reliable for payment IDs)
-            payments_result = self.rpc_call(
-                "get_payments", 
-                {"payment_id": payment_id},
-                wallet_rpc=True
-            )
+            # Method 1: get_payments (more reliable for payment IDs). The wallet height is
+            # reused for a few seconds; when stale it rides along in the same batch.
+            wallet_height = self._cached_height()
+            if wallet_height is None:
+                wallet_height_result, payments_result = self.rpc_batch([
+                    ("get_height", None),
+                    ("get_payments", {"payment_id": payment_id}),
+                ])
+                if not wallet_height_result:
+                    return None
+                wallet_height = self._store_height(wallet_height_result.get("height", 0))
+            else:
+                payments_result = self.rpc_call(
+                    "get_payments",
+                    {"payment_id": payment_id},
+                    wallet_rpc=True
+                )
             
-            if payments_result and 'payments' in payments_result:
-                for payment in payments_result['payments']:
-                    amount_xmr = Decimal(payment.get('amount', 0)) / Decimal(1e12)
-                    tx_hash = payment.get('tx_hash')
-                    block_height = payment.get('block_height', 0)
+            expected_threshold = Decimal(str(expected_amount)) - _TOLERANCE  # Allow small rounding
+            payments = (payments_result or {}).get('payments') or ()
+            for payment in payments:
+                amount_xmr = Decimal(int(payment.get('amount', 0))) / _PICONERO
+                tx_hash = payment.get('tx_hash')
+                block_height = payment.get('block_height', 0)
+                
+                if amount_xmr >= expected_threshold:
+                    confirmations = max(0, wallet_height - block_height) if block_height > 0 else 0
                     
-                    if amount_xmr >= Decimal(expected_amount) - Decimal('0.000001'):  # Allow small rounding
-                        confirmations = max(0, wallet_height - block_height) if block_height > 0 else 0
-                        
-                        return {
-                            "tx_hash": tx_hash,
-                            "amount": float(amount_xmr),
-                            "confirmations": confirmations,
-                            "block_height": block_height,
-                            "payment_id": payment_id
-                        }
+                    return {
+                        "tx_hash": tx_hash,
+                        "amount": float(amount_xmr),
+                        "confirmations": confirmations,
+                        "block_height": block_height,
+                        "payment_id": payment_id
+                    }
             
             # Method 2: Fallback to get_transfers (for older wallet versions)
+            # Only scan blocks that could hold a payment for a still-open order
             transfers_result = self.rpc_call("get_transfers", {
                 "in": True,
                 "pending": True,
-                "failed": False
+                "failed": False,
+                "filter_by_height": True,
+                "min_height": max(0, wallet_height - self._transfers_lookback),
             }, wallet_rpc=True)
             
-            if transfers_result and 'in' in transfers_result:
-                for transfer in transfers_result['in']:
-                    # Extract payment ID from address if possible
-                    if (transfer.get('address') and payment_id in transfer.get('address', '') and
-                        Decimal(transfer['amount']) / Decimal(1e12) >= Decimal(expected_amount)):
-                        
+            transfers = (transfers_result or {}).get('in') or ()
+            if transfers:
+                # Index by payment ID once instead of substring-matching every address
+                by_payment_id = {}
+                for transfer in transfers:
+                    transfer_payment_id = transfer.get('payment_id') or _extract_payment_id(transfer.get('address') or '')
+                    if transfer_payment_id:
+                        by_payment_id.setdefault(transfer_payment_id, []).append(transfer)
+
+                # Compare in atomic units so the loop does no Decimal work
+                expected_atomic = int(Decimal(str(expected_amount)) * _PICONERO)
+                for transfer in by_payment_id.get(payment_id, ()):
+                    if int(transfer['amount']) >= expected_atomic:
                         confirmations = transfer.get('confirmations', 0)
                         return {
                             'tx_hash': transfer.get('txid'),
-                            'amount': float(Decimal(transfer['amount']) / Decimal(1e12)),
+                            'amount': float(Decimal(int(transfer['amount'])) / _PICONERO),
                             'confirmations': confirmations,
                             'payment_id': payment_id
                         }
@@ -185,17 +367,12 @@ class MoneroHandler:
     def create_address(self, order_id):
         """Create a new payment address for an order (backward compatibility)"""
         try:
-            # Use the new payment request system but return simple address
-            payment_data = self.create_payment_request(
-                order_description=f"Order #{order_id}",
-                total_amount_xmr=0.0  # Amount will be set by caller
-            )
-            
-            if payment_data:
-                return {
-                    'integrated_address': payment_data['integrated_address'],
-                    'payment_id': payment_data['payment_id']
-                }
+            # Only the address is needed here, so skip building a payment request
+            payment_id, integrated_address = self._new_integrated_address()
+            return {
+                'integrated_address': integrated_address,
+                'payment_id': payment_id
+            }
         except Exception as e:
             logger.error(f"Error creating address: {e}")
         return None
@@ -206,8 +383,8 @@ class MoneroHandler:
             result = self.rpc_call("get_balance", wallet_rpc=True)
             if result:
                 return {
-                    'balance': float(Decimal(result['balance']) / Decimal(1e12)),
-                    'unlocked_balance': float(Decimal(result['unlocked_balance']) / Decimal(1e12))
+                    'balance': float(Decimal(int(result['balance'])) / _PICONERO),
+                    'unlocked_balance': float(Decimal(int(result['unlocked_balance'])) / _PICONERO)
                 }
         except Exception as e:
             logger.error(f"Error getting balance: {e}")
@@ -215,83 +392,220 @@ class MoneroHandler:
 
     def validate_address(self, address):
         """Validate Monero address"""
+        cached = self._address_cache.get(address)
+        if cached is not None:
+            return cached
         try:
             result = self.rpc_call("validate_address", {"address": address}, wallet_rpc=True)
-            return result.get('valid') if result else False
+            if not result:
+                # RPC failure is not an answer; don't remember it
+                return False
+            valid = bool(result.get('valid'))
+            self._address_cache[address] = valid
+            return valid
         except Exception as e:
             logger.error(f"Error validating address: {e}")
         return False
 
     def verify_payment_complete(self, order_id: int) -> bool:
         """Verify if payment is complete and update database"""
+        return self.verify_many([order_id]).get(order_id, False)
+
+    def verify_many(self, order_ids) -> Dict[int, bool]:
+        """Verify payments for several orders; returns order_id -> confirmed.
+
+        Orders are read in one short session, checked against the wallet with no session
+        held, and the results written back in a second session with one commit.
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+        results = {order_id: False for order_id in order_ids}
+        if not order_ids:
+            return results
         try:
             with Session() as session:
-                order = session.query(Order).filter(Order.id == order_id).first()
-                if not order:
+                lookups = {
+                    row.id: (row.payment_id, row.total_amount_xmr)
+                    for row in session.query(Order.id, Order.payment_id, Order.total_amount_xmr)
+                    .filter(Order.id.in_(order_ids))
+                }
+            for order_id in order_ids:
+                if order_id not in lookups:
                     logger.error(f"Order {order_id} not found")
-                    return False
 
-                # Check payment status
-                payment_info = self.check_payment(order.payment_id, order.total_amount_xmr)
-                
-                if payment_info:
-                    if payment_info.get("confirmations", 0) >= getattr(config, "CONFIRMATIONS_REQUIRED", 10):
-                        # Update order status
-                        if order.status != 'confirmed':
-                            order.status = 'confirmed'
-                            order.confirmed_at = datetime.utcnow()
-                        
-                        # Create or update payment record
-                        existing_payment = session.query(Payment).filter(
-                            Payment.order_id == order.id
-                        ).first()
-                        
-                        if not existing_payment:
-                            payment = Payment(
-                                order_id=order.id,
-                                tx_hash=payment_info.get("tx_hash"),
-                                amount_xmr=payment_info.get("amount", 0.0),
-                                confirmations=payment_info.get("confirmations", 0),
-                            )
-                            session.add(payment)
-                        
-                        session.commit()
-                        logger.info(f"Payment confirmed for order {order_id}")
-                        return True
-                    else:
-                        # Payment received but waiting for confirmations
-                        logger.info(f"Payment pending confirmations for order {order_id}")
-                        return False
-                else:
-                    # Check if payment expired
-                    if datetime.utcnow() > order.expires_at and order.status == 'pending':
+            # Wallet RPCs happen here, outside any transaction
+            payment_infos = {
+                order_id: self.check_payment(payment_id, expected_amount)
+                for order_id, (payment_id, expected_amount) in lookups.items()
+            }
+            if not payment_infos:
+                return results
+
+            with Session() as session:
+                orders = session.query(Order).filter(Order.id.in_(list(payment_infos))).all()
+                payments = {
+                    payment.order_id: payment
+                    for payment in session.query(Payment).filter(Payment.order_id.in_(list(payment_infos))).all()
+                }
+
+                _now = datetime.utcnow()
+                new_payments = []
+                confirmed = []
+                changed = []
+                for order in orders:
+                    order_id = order.id
+                    payment_info = payment_infos[order_id]
+
+                    if payment_info:
+                        if payment_info.get("confirmations", 0) >= self.confirmations_required:
+                            # Update order status
+                            if order.status != 'confirmed':
+                                order.status = 'confirmed'
+                                order.confirmed_at = _now
+                                self.invalidate_payment_cache(order.payment_id)
+                                changed.append(order_id)
+
+                            # Create payment record if there isn't one yet
+                            if order_id not in payments:
+                                payment = Payment(
+                                    order_id=order_id,
+                                    tx_hash=payment_info.get("tx_hash"),
+                                    amount_xmr=payment_info.get("amount", 0.0),
+                                    confirmations=payment_info.get("confirmations", 0),
+                                )
+                                payments[order_id] = payment
+                                new_payments.append(payment)
+                            confirmed.append(order_id)
+                        else:
+                            # Payment received but waiting for confirmations
+                            logger.info(f"Payment pending confirmations for order {order_id}")
+                    elif _now > order.expires_at and order.status == 'pending':
+                        # Payment expired
                         order.status = 'expired'
-                        session.commit()
+                        changed.append(order_id)
                         logger.info(f"Order {order_id} expired")
-                    
-                    return False
-                    
+
+                session.add_all(new_payments)
+                session.commit()
+
+            for order_id in changed:
+                self._status_cache.pop(order_id)
+
+            for order_id in confirmed:
+                results[order_id] = True
+                logger.info(f"Payment confirmed for order {order_id}")
         except Exception as e:
-            logger.error(f"Error verifying payment for order {order_id}: {e}")
-            return False
+            logger.error(f"Error verifying payments for orders {order_ids}: {e}")
+        return results
+
+    async def verify_all_pending(self, order_ids, concurrency: int = 8, chunk_size: int = 50) -> Dict[int, bool]:
+        """Verify many orders concurrently; returns order_id -> confirmed.
+
+        The ids are split into chunks of chunk_size, each handled by verify_many in a
+        worker thread, with at most `concurrency` chunks in flight.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def verify_chunk(chunk):
+            async with semaphore:
+                return await asyncio.to_thread(self.verify_many, chunk)
+
+        order_ids = list(dict.fromkeys(order_ids))
+        chunks = [order_ids[i:i + chunk_size] for i in range(0, len(order_ids), chunk_size)]
+        results = {}
+        for chunk_results in await asyncio.gather(*(verify_chunk(chunk) for chunk in chunks)):
+            results.update(chunk_results)
+        return results
+
+    def _watch_chain(self):
+        """Poll the daemon's tip and pool size once per interval and wake waiters on change.
+
+        Exits once no wait_for_payment() call is left; the next waiter starts a new one.
+        """
+        last_state = None
+        while True:
+            stopped = self._watch_stop.wait(self._watch_interval)
+            with self._chain_changed:
+                if stopped or self._waiters == 0:
+                    self._watcher = None
+                    self._chain_watch_ok = False
+                    return
+            info = self.rpc_call("get_info")
+            state = (info.get("height"), info.get("top_block_hash"), info.get("tx_pool_size")) if info else None
+            with self._chain_changed:
+                self._chain_watch_ok = state is not None
+                if state is not None and state != last_state:
+                    if last_state is None or state[:2] != last_state[:2]:
+                        self._block_generation += 1
+                    last_state = state
+                    self._chain_generation += 1
+                    self._chain_changed.notify_all()
+
+    def wait_for_payment(self, order_id: int, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until a payment for the order is seen (any confirmations) or timeout passes.
+
+        Rechecks when the daemon watcher sees a new block or pool transaction; without
+        a reachable daemon it falls back to polling every PAYMENT_CHECK_CACHE_TTL seconds.
+        """
+        with Session() as session:
+            order = session.get(Order, order_id)
+            if not order:
+                logger.error(f"Order {order_id} not found")
+                return None
+            payment_id, expected_amount = order.payment_id, order.total_amount_xmr
+
+        deadline = time.monotonic() + (timeout if timeout is not None else config.PAYMENT_TIMEOUT)
+        poll_interval = getattr(config, "PAYMENT_CHECK_CACHE_TTL", 10)
+
+        with self._chain_changed:
+            self._waiters += 1
+            if self.rpc_url and self._watcher is None:
+                self._watch_stop.clear()
+                self._watcher = threading.Thread(target=self._watch_chain, name="monero-chain-watch", daemon=True)
+                self._watcher.start()
+        try:
+            while True:
+                generation, block_generation = self._chain_generation, self._block_generation
+                payment_info = self.check_payment(payment_id, expected_amount)
+                if payment_info:
+                    return payment_info
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                with self._chain_changed:
+                    # The wallet refreshes on its own schedule, so even with a live watcher recheck
+                    # at least every 30 s in case it picked the transfer up between daemon changes
+                    wait = min(remaining, 30.0 if self._chain_watch_ok else poll_interval)
+                    self._chain_changed.wait_for(lambda: self._chain_generation != generation, timeout=wait)
+                # A new block forces a fresh wallet lookup; pool-only changes are frequent, so
+                # those rechecks go through check_payment's cache (at most one per TTL)
+                if self._block_generation != block_generation:
+                    self.invalidate_payment_cache(payment_id)
+        finally:
+            with self._chain_changed:
+                self._waiters -= 1
 
     def get_payment_status(self, order_id: int) -> Dict[str, Any]:
         """Get detailed payment status for an order"""
+        cached = self._status_cache.get(order_id)
+        if cached is not None:
+            return dict(cached)
         try:
             with Session() as session:
-                order = session.query(Order).filter(Order.id == order_id).first()
+                order = session.get(Order, order_id)
                 if not order:
                     return {"error": "Order not found"}
                 
+                # check_payment's TTL cache already covers a verify_payment_complete just before
                 payment_info = self.check_payment(order.payment_id, order.total_amount_xmr)
                 
+                _now = datetime.utcnow()
                 status_info = {
                     "order_id": order_id,
                     "status": order.status,
                     "expected_amount": order.total_amount_xmr,
                     "payment_id": order.payment_id,
                     "expires_at": order.expires_at.isoformat(),
-                    "is_expired": datetime.utcnow() > order.expires_at
+                    "is_expired": _now > order.expires_at
                 }
                 
                 if payment_info:
@@ -299,9 +613,9 @@ class MoneroHandler:
                         "payment_received": True,
                         "amount_received": payment_info.get("amount", 0.0),
                         "confirmations": payment_info.get("confirmations", 0),
-                        "confirmations_required": getattr(config, "CONFIRMATIONS_REQUIRED", 10),
+                        "confirmations_required": self.confirmations_required,
                         "tx_hash": payment_info.get("tx_hash"),
-                        "is_confirmed": payment_info.get("confirmations", 0) >= getattr(config, "CONFIRMATIONS_REQUIRED", 10)
+                        "is_confirmed": payment_info.get("confirmations", 0) >= self.confirmations_required
                     })
                 else:
                     status_info.update({
@@ -311,7 +625,8 @@ class MoneroHandler:
                         "is_confirmed": False
                     })
                 
-                return status_info
+                self._status_cache[order_id] = status_info
+                return dict(status_info)
                 
         except Exception as e:
             logger.error(f"Error getting payment status for order {order_id}: {e}")